@@ -1,18 +1,25 @@
 import os
 import sys
-import requests
+import hashlib
+import httpx
 import shutil
-import uuid
+import tempfile
+import secrets
 import json
 import asyncio
+import time
 import logging
+import logging.handlers
+import queue
+import atexit
 import traceback
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import Optional, Dict
-from urllib.parse import urlparse, unquote
+from pathlib import Path
+from typing import Optional, Dict, AsyncIterator
+from urllib.parse import quote, unquote
 from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form, Header, Depends
-from fastapi.responses import StreamingResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 
@@ -20,12 +27,14 @@ import uvicorn
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(CURRENT_DIR))
 
-# 工作目录配置（仅用于临时文件存储）
+# 工作目录配置（用于临时文件和响应缓存存储）
 WORKSPACE_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, '..', 'workspace'))
 WORKSPACE_TEMP = os.path.join(WORKSPACE_ROOT, 'temp')
+WORKSPACE_CACHE = os.path.join(WORKSPACE_ROOT, 'cache')
 
-# 确保临时目录存在
+# 确保临时目录和缓存目录存在
 os.makedirs(WORKSPACE_TEMP, exist_ok=True)
+os.makedirs(WORKSPACE_CACHE, exist_ok=True)
 
 # mineru 后端服务 URL
 MINERU_VLM_URL = os.environ.get('MINERU_VLM_URL', 'http://10.104.255.37:30010')
@@ -33,37 +42,119 @@ MINERU_VLM_URL = os.environ.get('MINERU_VLM_URL', 'http://10.104.255.37:30010')
 # 服务配置
 SERVER_HOST = os.environ.get('OCR_SERVER_HOST', '0.0.0.0')
 SERVER_PORT = int(os.environ.get('OCR_SERVER_PORT', '8081'))
+SERVER_WORKERS = int(os.environ.get('OCR_SERVER_WORKERS', '1'))
+# 开发模式（DEV=1）才启用热重载
+SERVER_RELOAD = os.environ.get('DEV', '0') == '1'
 
 # 线程池配置
 MAX_WORKERS = 30  # 最大并发线程数
 
+# 文件流式读写块大小
+CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# pdf_url 是否边下载边转发到后端（不落盘）；设为 0 时回退到先下载到临时文件再转发
+# 开启 FORWARD_CACHE 时 pdf_url 总是先下载到临时文件，以便转发前按内容查找缓存
+FORWARD_STREAM_URL = os.environ.get('FORWARD_STREAM_URL', '1') == '1'
+
+# 是否按 PDF 内容（SHA-256）缓存后端的成功响应，重复的 PDF 不再转发到后端；默认关闭
+# 缓存期间后端升级或令牌被吊销不会生效，且每次未命中需额外计算一次 SHA-256
+FORWARD_CACHE = os.environ.get('FORWARD_CACHE', '0') == '1'
+# 响应缓存有效期（秒），过期后重新转发到后端
+FORWARD_CACHE_TTL = int(os.environ.get('FORWARD_CACHE_TTL', '86400'))
+# 响应缓存最多保留的条目数，超过后删除最旧的条目
+FORWARD_CACHE_MAX_ENTRIES = int(os.environ.get('FORWARD_CACHE_MAX_ENTRIES', '10000'))
+
+# /files 下载方式：PROXY_FILES=1 时由本服务转发文件内容，=0 时重定向到后端地址
+PROXY_FILES = os.environ.get('PROXY_FILES', '1') == '1'
+# 部署在 nginx 之后时可设置内部 location 前缀（如 /internal_backend），由 nginx 通过 X-Accel-Redirect 转发文件
+FILES_ACCEL_REDIRECT_PREFIX = os.environ.get('FILES_ACCEL_REDIRECT_PREFIX', None)
+
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(os.path.join(WORKSPACE_ROOT, 'forward_service.log'), encoding='utf-8')
-    ]
-)
+# 请求路径上只把日志记录放入队列，格式化和写文件由 QueueListener 后台线程完成
+log_queue: queue.Queue = queue.Queue(-1)
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.StreamHandler(),
+    logging.FileHandler(os.path.join(WORKSPACE_ROOT, 'forward_service.log'), encoding='utf-8')
+]
+for log_handler in log_handlers:
+    log_handler.setFormatter(log_formatter)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+
+
+def start_log_listener():
+    """启动日志监听线程（已在运行时不重复启动）"""
+    if log_listener._thread is None:
+        log_listener.start()
+
+
+def stop_log_listener():
+    """停止日志监听线程，并写完队列中剩余的日志（已停止时直接在当前线程写出）"""
+    if log_listener._thread is not None:
+        log_listener.stop()
+    while True:
+        try:
+            log_listener.handle(log_queue.get_nowait())
+        except queue.Empty:
+            break
+
+
+# 导入时即启动，保证 lifespan 之外（如启动前、脚本中直接调用）的日志也能写出；
+# 进程退出时再停止一次，写出应用关闭之后产生的日志
+start_log_listener()
+atexit.register(stop_log_listener)
+
+# QueueHandler 只保留原始消息（含异常堆栈），完整格式由监听线程中的 handler 负责
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
 logger = logging.getLogger(__name__)
 
-# 线程池执行器（全局变量，在 lifespan 中初始化）
+# 线程池执行器（全局变量，在 lifespan 中初始化，仅用于本地文件读写）
 executor: Optional[ThreadPoolExecutor] = None
 
+# 后端 HTTP 客户端（全局变量，在 lifespan 中初始化，复用连接池）
+http_client: Optional[httpx.AsyncClient] = None
+# 下载 pdf_url 使用的 HTTP 客户端（与后端连接池分开：流式转发时下载连接会一直占用到
+# 后端请求结束，共用连接池时并发数达到上限后所有请求都会互相等待）
+download_client: Optional[httpx.AsyncClient] = None
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    global executor
+    global executor, http_client, download_client
+    # 启动日志监听线程（同一进程中再次启动应用时，上一次关闭已将其停止）
+    start_log_listener()
     # 启动时创建线程池
     executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
     print(f"[启动] 线程池已创建，最大并发数: {MAX_WORKERS}")
+    # 启动时创建后端 HTTP 客户端（keep-alive 连接池）
+    http_client = httpx.AsyncClient(
+        base_url=MINERU_VLM_URL,
+        limits=httpx.Limits(max_connections=MAX_WORKERS, max_keepalive_connections=MAX_WORKERS),
+        # 30分钟超时；连接池已满时最多等待 60 秒，避免请求无限排队
+        timeout=httpx.Timeout(1800.0, connect=10.0, pool=60.0)
+    )
+    print(f"[启动] 后端 HTTP 客户端已创建: {MINERU_VLM_URL}")
+    download_client = httpx.AsyncClient(
+        follow_redirects=True,  # 与原 requests.get 一致，跟随 pdf_url 的重定向
+        limits=httpx.Limits(max_connections=MAX_WORKERS, max_keepalive_connections=MAX_WORKERS),
+        timeout=httpx.Timeout(300.0, connect=10.0, pool=60.0)
+    )
     yield
+    # 关闭时释放后端连接和下载连接
+    if http_client:
+        await http_client.aclose()
+        print("[关闭] 后端 HTTP 客户端已关闭")
+    if download_client:
+        await download_client.aclose()
     # 关闭时清理线程池
     if executor:
         executor.shutdown(wait=True)
         print("[关闭] 线程池已关闭")
+    # 关闭时停止日志监听线程（会先写完队列中剩余的日志）
+    stop_log_listener()
 
 
 # 创建 FastAPI 应用
@@ -106,8 +197,9 @@ def get_client_ip(request: Request) -> str:
     # 优先从 X-Forwarded-For 获取（考虑代理情况）
     forwarded_for = request.headers.get('X-Forwarded-For')
     if forwarded_for:
-        # X-Forwarded-For 可能包含多个 IP，取第一个
-        return forwarded_for.split(',')[0].strip()
+        # X-Forwarded-For 可能包含多个 IP，取第一个（partition 不会构造中间列表）
+        first_ip, _, _ = forwarded_for.partition(',')
+        return first_ip.strip()
     
     # 其次从 X-Real-IP 获取
     real_ip = request.headers.get('X-Real-IP')
@@ -122,25 +214,28 @@ def get_client_ip(request: Request) -> str:
 
 
 def get_filename_from_url(pdf_url: str) -> str:
-    """从 URL 中提取文件名"""
-    parsed = urlparse(pdf_url)
-    path = unquote(parsed.path)
-    filename = os.path.basename(path)
+    """从 URL 中提取文件名（只需路径最后一段，用字符串切分代替 urlparse）"""
+    path = pdf_url.partition('#')[0].partition('?')[0]
+    if '://' in path:
+        # 去掉 scheme 和 host，只保留路径部分
+        path = path.partition('://')[2].partition('/')[2]
+    filename = unquote(path).rpartition('/')[2]
     if not filename or not filename.lower().endswith('.pdf'):
         filename = 'document.pdf'
     return filename
 
 
-def download_pdf(pdf_url: str, save_path: str) -> bool:
-    """下载 PDF 文件到指定路径"""
+async def download_pdf(pdf_url: str, save_path: str) -> bool:
+    """下载 PDF 文件到指定路径（异步流式下载，写盘在线程池中执行）"""
     try:
         logger.info(f"开始下载 PDF: {pdf_url}")
-        response = requests.get(pdf_url, stream=True, timeout=300)
-        response.raise_for_status()
-        
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        loop = asyncio.get_event_loop()
+        async with download_client.stream('GET', pdf_url) as response:
+            response.raise_for_status()
+            
+            with open(save_path, 'wb') as f:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    await loop.run_in_executor(executor, f.write, chunk)
         logger.info(f"PDF 下载成功: {save_path}")
         return True
     except Exception as e:
@@ -148,7 +243,228 @@ def download_pdf(pdf_url: str, save_path: str) -> bool:
         raise HTTPException(status_code=500, detail=f"下载 PDF 失败: {str(e)}")
 
 
-def forward_to_backend(
+def calculate_file_sha256(file_path: str) -> str:
+    """计算文件的 SHA-256 值"""
+    with open(file_path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            # Python 3.11+：读取与哈希循环在 C 层完成
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        sha256_hash = hashlib.sha256()
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256_hash.update(chunk)
+        return sha256_hash.hexdigest()
+
+
+def get_cache_key(pdf_sha256: str, authorization: Optional[str], data: dict) -> str:
+    """
+    生成响应缓存键
+    
+    缓存键包含 PDF 内容、Authorization 和处理参数，
+    不同参数或不同令牌的请求不会共用缓存（缓存命中时不会绕过后端鉴权）；
+    文件名不参与缓存键，与后端按 MD5 缓存的行为一致
+    """
+    params = {k: v for k, v in data.items() if k != 'pdf_filename'}
+    key_source = json.dumps(
+        {'pdf': pdf_sha256, 'authorization': authorization or '', 'params': params},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+
+def load_cached_response(cache_key: str) -> Optional[dict]:
+    """读取缓存的后端响应，未命中或已过期返回 None"""
+    cache_file = os.path.join(WORKSPACE_CACHE, f"{cache_key}.json")
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            if time.time() - os.fstat(f.fileno()).st_mtime > FORWARD_CACHE_TTL:
+                return None
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"读取响应缓存失败: {cache_file}, 错误: {str(e)}")
+        return None
+
+
+def save_cached_response(cache_key: str, result: dict):
+    """缓存后端的成功响应（先写临时文件再原子替换，避免并发读到不完整内容）"""
+    if not isinstance(result, dict) or not result.get('success'):
+        return
+    cache_file = os.path.join(WORKSPACE_CACHE, f"{cache_key}.json")
+    temp_file = f"{cache_file}.{secrets.token_hex(8)}.tmp"
+    try:
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(temp_file, cache_file)
+    except Exception as e:
+        logger.warning(f"写入响应缓存失败: {cache_file}, 错误: {str(e)}")
+        Path(temp_file).unlink(missing_ok=True)
+    prune_cached_responses()
+
+
+def prune_cached_responses():
+    """
+    删除过期的缓存条目，条目数超过 FORWARD_CACHE_MAX_ENTRIES 时再删除最旧的条目
+    只在写入缓存（即后端实际处理了一次请求）后执行，相比后端处理耗时可以忽略
+    """
+    now = time.time()
+    entries = []
+    try:
+        with os.scandir(WORKSPACE_CACHE) as it:
+            for entry in it:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                if now - mtime > FORWARD_CACHE_TTL:
+                    Path(entry.path).unlink(missing_ok=True)
+                else:
+                    entries.append((mtime, entry.path))
+    except OSError as e:
+        logger.warning(f"清理响应缓存失败: {WORKSPACE_CACHE}, 错误: {str(e)}")
+        return
+    if len(entries) > FORWARD_CACHE_MAX_ENTRIES:
+        entries.sort()
+        for _, path in entries[:len(entries) - FORWARD_CACHE_MAX_ENTRIES]:
+            Path(path).unlink(missing_ok=True)
+
+
+def link_or_copy(src_path: str, dst_path: str):
+    """
+    同一文件系统下创建硬链接（不拷贝数据），否则回退到复制
+    删除硬链接不会影响原文件
+    """
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copy2(src_path, dst_path)
+
+
+def save_upload_file(upload_file: UploadFile, save_path: str):
+    """
+    将上传文件保存到指定路径（在线程池中执行，避免阻塞事件循环）
+    
+    上传文件已落盘时（SpooledTemporaryFile 超出内存阈值）使用 os.sendfile
+    在内核态直接拷贝，否则回退到按块拷贝
+    """
+    src = upload_file.file
+    try:
+        with open(save_path, "wb") as buffer:
+            # 仍在内存中的小文件直接拷贝，避免为了 sendfile 先写一次磁盘
+            in_memory = isinstance(src, tempfile.SpooledTemporaryFile) and not getattr(src, '_rolled', True)
+            if hasattr(os, 'sendfile') and not in_memory:
+                try:
+                    src_fd = src.fileno()
+                    dst_fd = buffer.fileno()
+                    offset = 0
+                    while True:
+                        sent = os.sendfile(dst_fd, src_fd, offset, CHUNK_SIZE)
+                        if sent == 0:
+                            return
+                        offset += sent
+                except OSError as e:
+                    logger.warning(f"sendfile 拷贝失败，回退到普通拷贝: {save_path}, 错误: {str(e)}")
+                    buffer.seek(0)
+                    buffer.truncate()
+            src.seek(0)
+            shutil.copyfileobj(src, buffer, CHUNK_SIZE)
+    finally:
+        src.close()
+
+
+def build_forward_headers(client_ip: str, authorization: Optional[str] = None) -> dict:
+    """构建转发到后端的请求头（透传 Authorization 和 IP）"""
+    headers = {
+        'X-Forwarded-For': client_ip,
+        'X-Real-IP': client_ip
+    }
+    if authorization:
+        headers['Authorization'] = authorization
+    return headers
+
+
+def build_form_data(
+    filename: str,
+    vlm_url: Optional[str] = None,
+    backend: Optional[str] = None,
+    lang: Optional[str] = None,
+    formula: Optional[bool] = None,
+    table: Optional[bool] = None
+) -> dict:
+    """构建转发到后端的表单字段"""
+    data = {}
+    if filename:
+        data['pdf_filename'] = filename
+    if vlm_url:
+        data['vlm_url'] = vlm_url
+    if backend:
+        data['backend'] = backend
+    if lang:
+        data['lang'] = lang
+    if formula is not None:
+        data['formula'] = str(formula).lower()
+    if table is not None:
+        data['table'] = str(table).lower()
+    return data
+
+
+def build_multipart_head(boundary: str, data: dict, filename: str) -> bytes:
+    """生成 multipart/form-data 请求体中文件内容之前的部分（普通表单字段 + 文件部分的头）"""
+    parts = [
+        (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'
+        ).encode('utf-8')
+        for name, value in data.items()
+    ]
+    # 文件名中的引号和换行需要转义，避免破坏 Content-Disposition 头
+    safe_filename = filename.replace('\\', '\\\\').replace('"', '%22').replace('\r', '').replace('\n', '')
+    parts.append((
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{safe_filename}"\r\n'
+        f'Content-Type: application/pdf\r\n\r\n'
+    ).encode('utf-8'))
+    return b''.join(parts)
+
+
+def build_multipart_tail(boundary: str) -> bytes:
+    """生成 multipart/form-data 请求体的结尾"""
+    return f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+
+async def iter_multipart_body(
+    boundary: str,
+    data: dict,
+    filename: str,
+    file_chunks: AsyncIterator[bytes]
+) -> AsyncIterator[bytes]:
+    """
+    生成 multipart/form-data 请求体，文件部分直接来自异步数据流
+    
+    Args:
+        boundary: multipart 分隔符
+        data: 普通表单字段
+        filename: 文件名
+        file_chunks: 文件内容的异步数据流
+    """
+    yield build_multipart_head(boundary, data, filename)
+    async for chunk in file_chunks:
+        yield chunk
+    yield build_multipart_tail(boundary)
+
+
+async def iter_file_chunks(f) -> AsyncIterator[bytes]:
+    """按块读取已打开的本地文件（读取在线程池中执行，不阻塞事件循环）"""
+    loop = asyncio.get_event_loop()
+    while chunk := await loop.run_in_executor(executor, f.read, CHUNK_SIZE):
+        yield chunk
+
+
+async def forward_to_backend(
     file_path: str,
     filename: str,
     client_ip: str,
@@ -182,49 +498,53 @@ def forward_to_backend(
         logger.info(f"转发请求到后端: {backend_url}, 文件: {filename}, IP: {client_ip}")
         
         # 准备请求头（透传 Authorization 和 IP）
-        headers = {
-            'X-Forwarded-For': client_ip,
-            'X-Real-IP': client_ip
-        }
-        if authorization:
-            headers['Authorization'] = authorization
+        headers = build_forward_headers(client_ip, authorization)
         
-        # 准备 multipart/form-data
-        with open(file_path, 'rb') as f:
-            files = {'file': (filename, f, 'application/pdf')}
-            data = {}
-            
-            if filename:
-                data['pdf_filename'] = filename
-            if vlm_url:
-                data['vlm_url'] = vlm_url
-            if backend:
-                data['backend'] = backend
-            if lang:
-                data['lang'] = lang
-            if formula is not None:
-                data['formula'] = str(formula).lower()
-            if table is not None:
-                data['table'] = str(table).lower()
+        data = build_form_data(filename, vlm_url, backend, lang, formula, table)
+        
+        # 相同 PDF、相同参数的请求直接返回缓存的响应
+        loop = asyncio.get_event_loop()
+        cache_key = None
+        if FORWARD_CACHE:
+            pdf_sha256 = await loop.run_in_executor(executor, calculate_file_sha256, file_path)
+            cache_key = get_cache_key(pdf_sha256, authorization, data)
+            cached = await loop.run_in_executor(executor, load_cached_response, cache_key)
+            if cached is not None:
+                logger.info(f"命中响应缓存: {filename}, SHA-256: {pdf_sha256}, IP: {client_ip}")
+                return cached
+        
+        # 准备 multipart/form-data：文件内容在线程池中按块读取，
+        # 并显式设置 Content-Length（不使用 chunked，兼容不支持 chunked 上传的后端）
+        boundary = secrets.token_hex(16)
+        headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        head = build_multipart_head(boundary, data, filename)
+        tail = build_multipart_tail(boundary)
+        f = await loop.run_in_executor(executor, open, file_path, 'rb')
+        try:
+            file_size = os.fstat(f.fileno()).st_size
+            headers['Content-Length'] = str(len(head) + file_size + len(tail))
+            body = iter_multipart_body(boundary, data, filename, iter_file_chunks(f))
             
-            # 发送请求到后端（携带 headers）
-            response = requests.post(
-                backend_url,
-                files=files,
-                data=data,
-                headers=headers,
-                timeout=1800  # 30分钟超时
-            )
+            # 通过共享连接池发送请求到后端（携带 headers）
+            response = await http_client.post('/file_mineru', content=body, headers=headers)
             response.raise_for_status()
             
             result = response.json()
             logger.info(f"后端处理成功: {filename}")
-            return result
+        finally:
+            f.close()
+        
+        if cache_key:
+            await loop.run_in_executor(executor, save_cached_response, cache_key, result)
+        return result
             
-    except requests.exceptions.Timeout:
+    except httpx.PoolTimeout:
+        logger.error(f"后端连接池已满 - 文件: {filename}")
+        raise HTTPException(status_code=503, detail="后端连接繁忙，请稍后重试")
+    except httpx.TimeoutException:
         logger.error(f"后端请求超时 - 文件: {filename}")
         raise HTTPException(status_code=504, detail="后端服务处理超时")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"后端请求失败 - 文件: {filename}, 错误: {str(e)}", exc_info=True)
         raise HTTPException(status_code=502, detail=f"后端服务请求失败: {str(e)}")
     except Exception as e:
@@ -233,13 +553,84 @@ def forward_to_backend(
     finally:
         # 清理临时文件
         try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"临时文件已清理: {file_path}")
-        except Exception as e:
+            Path(file_path).unlink(missing_ok=True)
+            logger.info(f"临时文件已清理: {file_path}")
+        except OSError as e:
             logger.warning(f"清理临时文件失败: {file_path}, 错误: {str(e)}")
 
 
+async def forward_url_to_backend(
+    pdf_url: str,
+    filename: str,
+    client_ip: str,
+    authorization: Optional[str] = None,
+    vlm_url: Optional[str] = None,
+    backend: Optional[str] = None,
+    lang: Optional[str] = None,
+    formula: Optional[bool] = None,
+    table: Optional[bool] = None
+) -> dict:
+    """
+    边下载 pdf_url 边转发到后端 MinerU 服务（不落盘）
+    
+    Args:
+        pdf_url: PDF 文件 URL
+        其余参数同 forward_to_backend
+    
+    Returns:
+        后端响应的 JSON 数据
+    """
+    backend_url = f"{MINERU_VLM_URL.rstrip('/')}/file_mineru"
+    
+    # 打开 PDF 下载流
+    source = None
+    try:
+        logger.info(f"开始下载 PDF: {pdf_url}")
+        source = await download_client.send(
+            download_client.build_request('GET', pdf_url),
+            stream=True
+        )
+        source.raise_for_status()
+    except httpx.HTTPError as e:
+        if source is not None:
+            await source.aclose()
+        logger.error(f"下载 PDF 失败 - URL: {pdf_url}, 错误: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"下载 PDF 失败: {str(e)}")
+    
+    try:
+        logger.info(f"流式转发请求到后端: {backend_url}, 文件: {filename}, IP: {client_ip}")
+        
+        # 准备请求头（透传 Authorization 和 IP）
+        boundary = secrets.token_hex(16)
+        headers = build_forward_headers(client_ip, authorization)
+        headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        
+        data = build_form_data(filename, vlm_url, backend, lang, formula, table)
+        body = iter_multipart_body(boundary, data, filename, source.aiter_bytes(CHUNK_SIZE))
+        
+        # 通过共享连接池发送请求到后端（请求体以 chunked 方式流式发送）
+        response = await http_client.post('/file_mineru', content=body, headers=headers)
+        response.raise_for_status()
+        
+        result = response.json()
+        logger.info(f"后端处理成功: {filename}")
+        return result
+    except httpx.PoolTimeout:
+        logger.error(f"后端连接池已满 - 文件: {filename}, URL: {pdf_url}")
+        raise HTTPException(status_code=503, detail="后端连接繁忙，请稍后重试")
+    except httpx.TimeoutException:
+        logger.error(f"后端请求超时 - 文件: {filename}, URL: {pdf_url}")
+        raise HTTPException(status_code=504, detail="后端服务处理超时")
+    except httpx.HTTPError as e:
+        logger.error(f"后端请求失败 - 文件: {filename}, URL: {pdf_url}, 错误: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=502, detail=f"后端服务请求失败: {str(e)}")
+    except Exception as e:
+        logger.error(f"转发请求异常 - 文件: {filename}, URL: {pdf_url}, 错误: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"转发请求失败: {str(e)}")
+    finally:
+        await source.aclose()
+
+
 @app.get("/")
 async def root():
     """根路径，返回服务信息"""
@@ -265,7 +656,7 @@ async def mineru_endpoint(
     2. pdf_path: 使用本地文件路径
     
     处理流程：
-    1. 下载或复制 PDF 到临时目录
+    1. 下载或复制 PDF 到临时目录（pdf_url 默认边下载边转发，不落盘）
     2. 转发到后端 MinerU 服务（透传 Authorization 和 IP）
     3. 返回后端响应
     """
@@ -280,8 +671,23 @@ async def mineru_endpoint(
         raise HTTPException(status_code=400, detail="只能提供 pdf_url 或 pdf_path 其中一个")
     
     try:
+        # pdf_url 直接流式转发，不经过临时文件（开启响应缓存时需先落盘按内容查找缓存）
+        if body.pdf_url and FORWARD_STREAM_URL and not FORWARD_CACHE:
+            filename = body.pdf_filename or get_filename_from_url(body.pdf_url)
+            return await forward_url_to_backend(
+                body.pdf_url,
+                filename,
+                client_ip,
+                authorization,
+                body.vlm_url,
+                body.backend,
+                body.lang,
+                body.formula,
+                body.table
+            )
+        
         # 生成唯一的临时文件名
-        temp_filename = f"{uuid.uuid4().hex}.pdf"
+        temp_filename = f"{secrets.token_hex(16)}.pdf"
         temp_pdf_path = os.path.join(WORKSPACE_TEMP, temp_filename)
         
         # 处理本地文件或 URL
@@ -293,17 +699,15 @@ async def mineru_endpoint(
                 raise HTTPException(status_code=400, detail="只支持 PDF 文件")
             
             filename = body.pdf_filename or os.path.basename(body.pdf_path)
-            shutil.copy2(body.pdf_path, temp_pdf_path)
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(executor, link_or_copy, body.pdf_path, temp_pdf_path)
             logger.info(f"本地文件已复制: {body.pdf_path} -> {temp_pdf_path}")
         else:
             filename = body.pdf_filename or get_filename_from_url(body.pdf_url)
-            download_pdf(body.pdf_url, temp_pdf_path)
+            await download_pdf(body.pdf_url, temp_pdf_path)
         
-        # 使用线程池异步转发到后端
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            forward_to_backend,
+        # 异步转发到后端
+        result = await forward_to_backend(
             temp_pdf_path,
             filename,
             client_ip,
@@ -358,23 +762,17 @@ async def file_mineru_endpoint(
 
     try:
         # 生成唯一的临时文件名
-        temp_filename = f"{uuid.uuid4().hex}.pdf"
+        temp_filename = f"{secrets.token_hex(16)}.pdf"
         temp_pdf_path = os.path.join(WORKSPACE_TEMP, temp_filename)
         
-        # 保存上传的文件
-        try:
-            logger.info(f"保存上传文件: {filename} -> {temp_pdf_path}")
-            with open(temp_pdf_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            logger.info(f"文件保存成功: {temp_pdf_path}")
-        finally:
-            file.file.close()
-        
-        # 使用线程池异步转发到后端
+        # 使用线程池保存上传的文件
+        logger.info(f"保存上传文件: {filename} -> {temp_pdf_path}")
         loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            forward_to_backend,
+        await loop.run_in_executor(executor, save_upload_file, file, temp_pdf_path)
+        logger.info(f"文件保存成功: {temp_pdf_path}")
+        
+        # 异步转发到后端
+        result = await forward_to_backend(
             temp_pdf_path,
             filename,
             client_ip,
@@ -403,10 +801,26 @@ async def download_file(path: str, request: Request):
     将文件下载请求转发到后端 MinerU 服务（统一使用 GET 方法）
     示例: /files/output/6185e4983f3b150745fd25d09cf15e41/6185e4983f3b150745fd25d09cf15e41/vlm/6185e4983f3b150745fd25d09cf15e41_model.json
     将转发到: http://10.104.255.37:30010/files/output/.../...
+    
+    PROXY_FILES=0 时直接重定向到后端地址；配置了 FILES_ACCEL_REDIRECT_PREFIX 时交由 nginx 转发
     """
     client_ip = get_client_ip(request)
     logger.info(f"[API /files] Method: {request.method}, IP: {client_ip}, Path: {path}")
     
+    encoded_path = quote(path, safe='/')
+    
+    # 客户端可直连后端时重定向，文件内容不经过本服务（POST 使用 303 以转为 GET）
+    if not PROXY_FILES:
+        redirect_url = f"{MINERU_VLM_URL.rstrip('/')}/files/{encoded_path}"
+        logger.info(f"重定向文件下载请求到: {redirect_url}")
+        return RedirectResponse(url=redirect_url, status_code=307 if request.method == 'GET' else 303)
+    
+    # 由 nginx 内部转发文件内容
+    if FILES_ACCEL_REDIRECT_PREFIX:
+        accel_path = f"{FILES_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{encoded_path}"
+        logger.info(f"交由 nginx 转发文件下载请求: {accel_path}")
+        return Response(headers={'X-Accel-Redirect': accel_path})
+    
     try:
         # 构建后端文件下载 URL
         backend_url = f"{MINERU_VLM_URL.rstrip('/')}/files/{path}"
@@ -422,38 +836,48 @@ async def download_file(path: str, request: Request):
         if request.headers.get('Authorization'):
             headers['Authorization'] = request.headers.get('Authorization')
         
-        # 统一使用 GET 方法访问后端文件下载接口
-        response = requests.get(
-            backend_url,
+        # 统一使用 GET 方法访问后端文件下载接口（复用共享连接池，流式读取）
+        backend_request = http_client.build_request(
+            'GET',
+            f"/files/{path}",
             headers=headers,
-            stream=True,
             timeout=300
         )
-        response.raise_for_status()
+        response = await http_client.send(backend_request, stream=True)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError:
+            await response.aclose()
+            raise
         
         # 提取文件名
         filename = os.path.basename(path)
         content_type = response.headers.get('Content-Type', 'application/octet-stream')
         
-        # 流式返回文件内容
-        def iterfile():
+        # 流式返回文件内容（原样透传字节，不做解压）
+        async def iterfile():
             try:
-                for chunk in response.iter_content(chunk_size=8192):
+                async for chunk in response.aiter_raw(chunk_size=CHUNK_SIZE):
                     if chunk:
                         yield chunk
             finally:
-                response.close()
+                await response.aclose()
+        
+        response_headers = {
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        }
+        # 透传原始字节时需同时透传压缩编码
+        if response.headers.get('Content-Encoding'):
+            response_headers['Content-Encoding'] = response.headers.get('Content-Encoding')
         
         logger.info(f"文件下载成功: {filename}")
         return StreamingResponse(
             iterfile(),
             media_type=content_type,
-            headers={
-                'Content-Disposition': f'attachment; filename="{filename}"'
-            }
+            headers=response_headers
         )
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"[API /files] 下载失败, IP: {client_ip}, Path: {path}, 错误: {str(e)}")
         raise HTTPException(status_code=502, detail=f"文件下载失败: {str(e)}")
     except Exception as e:
@@ -462,5 +886,15 @@ async def download_file(path: str, request: Request):
 
 
 if __name__ == "__main__":
-    uvicorn.run("services.apis_forward:app", host=SERVER_HOST, port=SERVER_PORT, reload=True)
+    # loop/http 使用 auto：已安装 uvloop、httptools（uvicorn[standard]）时自动使用，
+    # 未安装时（如 Windows）回退到 asyncio 和 h11；热重载仅在开发模式下启用
+    uvicorn.run(
+        "services.apis_forward:app",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        loop="auto",
+        http="auto",
+        workers=SERVER_WORKERS,
+        reload=SERVER_RELOAD
+    )
 
@@ -1,23 +1,40 @@
 import os
 import sys
 import hashlib
-import subprocess
-import requests
+import httpx
 import shutil
+import tempfile
+import signal
 import shlex  # 新增：用于安全地拼接 shell 命令字符串
 import uuid
 import json
 import fitz  # PyMuPDF
 import asyncio
+import time
 import logging
+import logging.handlers
+import queue
+import atexit
+import threading
 import traceback
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from functools import lru_cache
+from pathlib import Path
 from typing import Optional, Literal, Dict
-from urllib.parse import quote, urlparse, unquote
-from filelock import FileLock, Timeout
+from urllib.parse import quote, unquote
+from filelock import AsyncFileLock, Timeout
+
+try:
+    import blake3  # 可选依赖，OCR_HASH_ALG=blake3 时使用
+except ImportError:
+    blake3 = None
 from fastapi import FastAPI, HTTPException, Query, Request, UploadFile, File, Form, Header, Depends
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
 from pydantic import BaseModel, Field
 import uvicorn
 
@@ -29,15 +46,25 @@ sys.path.append(os.path.dirname(CURRENT_DIR))
 WORKSPACE_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, '..', 'workspace'))
 WORKSPACE_INPUT = os.path.join(WORKSPACE_ROOT, 'input')
 WORKSPACE_OUTPUT = os.path.join(WORKSPACE_ROOT, 'output')
+# 上传/下载的临时文件目录（与正式输入目录位于同一文件系统，移动时为原子 rename）
+WORKSPACE_TEMP = os.path.join(WORKSPACE_INPUT, 'temp')
 
-# 确保工作目录存在
+# 确保工作目录存在（启动时创建一次，请求中不再检查）
 os.makedirs(WORKSPACE_INPUT, exist_ok=True)
 os.makedirs(WORKSPACE_OUTPUT, exist_ok=True)
+os.makedirs(WORKSPACE_TEMP, exist_ok=True)
 
 # 文件锁目录
 WORKSPACE_LOCKS = os.path.join(WORKSPACE_ROOT, 'locks')
 os.makedirs(WORKSPACE_LOCKS, exist_ok=True)
 
+# pdf_url -> 摘要 映射缓存目录：有效期内重复请求同一 URL 时不再下载
+WORKSPACE_URL_CACHE = os.path.join(WORKSPACE_ROOT, 'url_cache')
+os.makedirs(WORKSPACE_URL_CACHE, exist_ok=True)
+
+# 处理完成标记文件（位于 output/<md5>/ 下，记录输出文件列表和 md 文件路径）
+DONE_MARKER = '.done.json'
+
 # mineru 配置
 MINERU_VLM_URL = os.environ.get('MINERU_VLM_URL', 'http://10.104.255.37:30010')
 MINERU_BACKEND = os.environ.get('MINERU_BACKEND', 'vlm-http-client')
@@ -45,21 +72,96 @@ MINERU_BACKEND = os.environ.get('MINERU_BACKEND', 'vlm-http-client')
 # 服务配置
 SERVER_HOST = os.environ.get('OCR_SERVER_HOST', '0.0.0.0')
 SERVER_PORT = int(os.environ.get('OCR_SERVER_PORT', '8081'))
+# 多进程时每个进程各自限制 mineru 并发（OCR_CONCURRENCY），同一文件仍由文件锁互斥
+SERVER_WORKERS = int(os.environ.get('OCR_SERVER_WORKERS', '1'))
+# 开发模式（DEV=1）才启用热重载
+SERVER_RELOAD = os.environ.get('DEV', '0') == '1'
 # DOWNLOAD_BASE_URL 将从请求中动态获取，这里保留环境变量作为 fallback
 DOWNLOAD_BASE_URL = os.environ.get('OCR_DOWNLOAD_BASE_URL', None)
 
 # 线程池配置
 MAX_WORKERS = 30  # 最大并发线程数
 
+# pdf_url 映射缓存有效期（秒），默认 0 不缓存；URL 内容可能变化，按数据源情况开启
+URL_CACHE_TTL = int(os.environ.get('OCR_URL_CACHE_TTL', '0'))
+
+# 上传 / pdf_url 下载的 PDF 大小上限（字节），超过时返回 413；默认 0 不限制
+MAX_PDF_BYTES = int(os.environ.get('OCR_MAX_PDF_BYTES', '0'))
+
+# 同时运行的 mineru 进程数上限，默认与线程池大小相同；后端 GPU 资源有限时可调小
+MINERU_CONCURRENCY = int(os.environ.get('OCR_CONCURRENCY', MAX_WORKERS))
+# 等待运行 mineru 的任务数上限，超过后直接返回 429（0 表示不限制）
+MINERU_QUEUE_LIMIT = int(os.environ.get('OCR_QUEUE_LIMIT', '0'))
+MINERU_RETRY_AFTER = 60  # 返回 429 时建议客户端等待的秒数
+
+# mineru 输出只保留最后这么多字节（用于失败时的错误信息），避免大量日志占用内存
+MINERU_OUTPUT_TAIL = 64 * 1024
+# mineru 退出后等待输出读取完成的最长秒数
+MINERU_READER_GRACE = 5
+# 轮询 mineru 退出状态的间隔秒数
+MINERU_POLL_INTERVAL = 0.5
+
+# 文件流式读写块大小
+CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# markdown 内容缓存：按总字节数限制内存占用，过大的文档不缓存
+MD_CACHE_MAX_BYTES = 64 << 20  # 64 MiB
+MD_CACHE_MAX_ENTRY_BYTES = 4 << 20  # 4 MiB
+
+# 文件去重使用的哈希算法（hashlib 支持的算法名，如 md5、sha256、blake2b）
+# 默认 md5，与已有 workspace 目录保持一致；响应中的 md5 字段与目录名均为该算法的摘要
+# 设为 fingerprint 时只对 文件大小 + 首尾各 1 MiB 计算 BLAKE2b，耗时与文件大小无关，
+# 但中间内容不同而首尾和大小相同的文件会被视为同一文件
+# 设为 blake3 时使用 blake3 库（需 pip install blake3，SIMD 加速，本地文件多线程计算）
+HASH_ALG = os.environ.get('OCR_HASH_ALG', 'md5').lower()
+FINGERPRINT_BLOCK_SIZE = 1 << 20  # fingerprint 模式下首尾各读取的字节数
+if HASH_ALG == 'blake3':
+    if blake3 is None:
+        print(f"警告: OCR_HASH_ALG=blake3 需要安装 blake3，使用 md5")
+        HASH_ALG = 'md5'
+elif HASH_ALG != 'fingerprint' and (HASH_ALG not in hashlib.algorithms_available or HASH_ALG.startswith('shake')):
+    print(f"警告: OCR_HASH_ALG={HASH_ALG} 不受支持，使用 md5")
+    HASH_ALG = 'md5'
+
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(os.path.join(WORKSPACE_ROOT, 'ocr_service.log'), encoding='utf-8')
-    ]
-)
+# 请求路径上只把日志记录放入队列，格式化和写文件由 QueueListener 后台线程完成
+log_queue: queue.Queue = queue.Queue(-1)
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.StreamHandler(),
+    logging.FileHandler(os.path.join(WORKSPACE_ROOT, 'ocr_service.log'), encoding='utf-8')
+]
+for log_handler in log_handlers:
+    log_handler.setFormatter(log_formatter)
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+
+
+def start_log_listener():
+    """启动日志监听线程（已在运行时不重复启动）"""
+    if log_listener._thread is None:
+        log_listener.start()
+
+
+def stop_log_listener():
+    """停止日志监听线程，并写完队列中剩余的日志（已停止时直接在当前线程写出）"""
+    if log_listener._thread is not None:
+        log_listener.stop()
+    while True:
+        try:
+            log_listener.handle(log_queue.get_nowait())
+        except queue.Empty:
+            break
+
+
+# 导入时即启动，保证 lifespan 之外（如启动前、脚本中直接调用）的日志也能写出；
+# 进程退出时再停止一次，写出应用关闭之后产生的日志
+start_log_listener()
+atexit.register(stop_log_listener)
+
+# QueueHandler 只保留原始消息（含异常堆栈），完整格式由监听线程中的 handler 负责
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
 logger = logging.getLogger(__name__)
 
 # API Key 鉴权配置（支持多用户）
@@ -82,20 +184,40 @@ elif os.environ.get('OCR_API_KEY', None):
 
 # 线程池执行器（全局变量，在 lifespan 中初始化）
 executor: Optional[ThreadPoolExecutor] = None
+# 下载 pdf_url 使用的 HTTP 客户端（全局变量，在 lifespan 中初始化，复用连接）
+http_client: Optional[httpx.AsyncClient] = None
+# mineru 并发限制（mineru 子进程不占用线程，由信号量限制同时运行的进程数）
+mineru_semaphore: Optional[asyncio.Semaphore] = None
+mineru_waiting = 0  # 正在等待 mineru_semaphore 的任务数
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    global executor
+    global executor, mineru_semaphore, http_client
+    # 启动日志监听线程（同一进程中再次启动应用时，上一次关闭已将其停止）
+    start_log_listener()
     # 启动时创建线程池
     executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
     print(f"[启动] 线程池已创建，最大并发数: {MAX_WORKERS}")
+    mineru_semaphore = asyncio.Semaphore(MINERU_CONCURRENCY)
+    print(f"[启动] mineru 最大并发数: {MINERU_CONCURRENCY}，排队上限: {MINERU_QUEUE_LIMIT or '不限制'}")
+    # 启动时创建下载用 HTTP 客户端（keep-alive 连接池，同一来源的多个 PDF 复用连接）
+    http_client = httpx.AsyncClient(
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=MAX_WORKERS, max_keepalive_connections=MAX_WORKERS),
+        timeout=httpx.Timeout(300.0)
+    )
     yield
+    # 关闭时释放下载连接
+    if http_client:
+        await http_client.aclose()
     # 关闭时清理线程池
     if executor:
         executor.shutdown(wait=True)
         print("[关闭] 线程池已关闭")
+    # 关闭时停止日志监听线程（会先写完队列中剩余的日志）
+    stop_log_listener()
 
 
 # 创建 FastAPI 应用
@@ -106,8 +228,47 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+class ZeroCopyFileResponse(FileResponse):
+    """
+    输出文件响应：
+    - 服务器支持 ASGI zerocopysend 扩展时，直接把文件交给服务器用 sendfile 发送，不经过用户态
+    - 支持 pathsend 扩展时由 starlette 按路径交给服务器发送
+    - 否则按 1 MiB 分块读取发送（默认 64 KiB），减少读取与 send 次数
+    """
+    chunk_size = CHUNK_SIZE
+
+    async def __call__(self, scope, receive, send) -> None:
+        if (
+            scope["type"] == "http"
+            and scope["method"].upper() == "GET"
+            and "http.response.zerocopysend" in scope.get("extensions", {})
+            and self.status_code == 200
+            and "range" not in Headers(scope=scope)
+        ):
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            with open(self.path, 'rb') as f:
+                await send({"type": "http.response.zerocopysend", "file": f, "more_body": False})
+            if self.background is not None:
+                await self.background()
+            return
+        # HEAD、Range 请求以及不支持 zerocopysend 的服务器走 starlette 默认逻辑
+        await super().__call__(scope, receive, send)
+
+
+class ZeroCopyStaticFiles(StaticFiles):
+    """使用 ZeroCopyFileResponse 返回文件的静态文件服务"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+
+        response = ZeroCopyFileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
 # 挂载静态文件服务
-app.mount("/files", StaticFiles(directory=WORKSPACE_ROOT), name="files")
+app.mount("/files", ZeroCopyStaticFiles(directory=WORKSPACE_ROOT), name="files")
 
 
 class MinerUCommandParams(BaseModel):
@@ -182,13 +343,135 @@ class MinerUResponse(BaseModel):
     download_urls: Optional[dict] = None
 
 
-def calculate_file_md5(file_path: str) -> str:
-    """计算文件的 MD5 值"""
-    md5_hash = hashlib.md5()
+def fingerprint_fileobj(f) -> str:
+    """
+    计算文件指纹：BLAKE2b(文件大小 + 前 1 MiB + 后 1 MiB)
+    只读取固定字节数，耗时与文件大小无关
+    """
+    fingerprint = hashlib.blake2b(digest_size=16)
+    size = f.seek(0, os.SEEK_END)
+    f.seek(0)
+    fingerprint.update(size.to_bytes(8, 'little'))
+    fingerprint.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    if size > FINGERPRINT_BLOCK_SIZE:
+        # 不足 2 MiB 时从首块之后开始读，保证所有字节都参与计算
+        f.seek(max(FINGERPRINT_BLOCK_SIZE, size - FINGERPRINT_BLOCK_SIZE))
+        fingerprint.update(f.read())
+    return fingerprint.hexdigest()
+
+
+def calculate_file_fingerprint(file_path: str) -> str:
+    """计算文件指纹（见 fingerprint_fileobj）"""
     with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(8192), b''):
-            md5_hash.update(chunk)
-    return md5_hash.hexdigest()
+        return fingerprint_fileobj(f)
+
+
+def advise_sequential_read(fd: int):
+    """提示内核该文件将被顺序读取（加大预读），不支持 posix_fadvise 的平台直接忽略"""
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def calculate_file_digest(file_path: str) -> str:
+    """计算文件的摘要值（算法由 OCR_HASH_ALG 指定，默认 MD5）"""
+    if HASH_ALG == 'fingerprint':
+        return calculate_file_fingerprint(file_path)
+    if HASH_ALG == 'blake3':
+        # 内存映射整个文件，由 blake3 多线程计算
+        file_hash = blake3.blake3(max_threads=blake3.blake3.AUTO)
+        file_hash.update_mmap(file_path)
+        return file_hash.hexdigest()
+    with open(file_path, 'rb') as f:
+        advise_sequential_read(f.fileno())
+        return digest_fileobj(f)
+
+
+def digest_fileobj(f) -> str:
+    """从当前位置读到末尾，计算摘要（算法由 OCR_HASH_ALG 指定，不含 fingerprint）"""
+    if hasattr(hashlib, 'file_digest'):
+        # Python 3.11+：读取与哈希循环在 C 层完成，并释放 GIL
+        return hashlib.file_digest(f, new_file_hasher).hexdigest()
+    file_hash = new_file_hasher()
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+        file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def calculate_upload_digest(src) -> str:
+    """
+    直接对上传文件（Starlette 的 SpooledTemporaryFile）计算摘要，不先写入 temp 目录
+    计算完成后读取位置复位到开头，供 save_upload_file 继续使用
+    """
+    src.seek(0)
+    digest = fingerprint_fileobj(src) if HASH_ALG == 'fingerprint' else digest_fileobj(src)
+    src.seek(0)
+    return digest
+
+
+@lru_cache(maxsize=1024)
+def _cached_file_digest(file_path: str, mtime_ns: int, size: int) -> str:
+    """按 (路径, 修改时间, 大小) 缓存摘要，文件被修改后 mtime/size 变化即重新计算"""
+    return calculate_file_digest(file_path)
+
+
+def get_local_file_digest(file_path: str) -> str:
+    """计算本地文件（pdf_path）的摘要，同一文件重复提交时直接使用缓存结果"""
+    st = os.stat(file_path)
+    return _cached_file_digest(os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+
+
+def new_file_hasher():
+    """
+    创建用于边写边算的哈希对象
+    fingerprint 模式需要读取文件尾部，无法在写入过程中计算，返回 None
+    """
+    if HASH_ALG == 'fingerprint':
+        return None
+    if HASH_ALG == 'blake3':
+        return blake3.blake3()
+    return hashlib.new(HASH_ALG)
+
+
+def sendfile_upload(src, out_fd: int) -> bool:
+    """
+    使用 os.sendfile 将上传文件从当前位置复制到 out_fd
+    仅在上传文件已落盘（SpooledTemporaryFile 已 rollover）时使用，否则返回 False 由调用方按块复制
+    """
+    if not hasattr(os, 'sendfile'):
+        return False
+    # 仍在内存中的 SpooledTemporaryFile 调用 fileno() 会先写入磁盘，反而多一次 I/O
+    if isinstance(src, tempfile.SpooledTemporaryFile) and not getattr(src, '_rolled', False):
+        return False
+    try:
+        in_fd = src.fileno()
+        offset = src.tell()
+    except (AttributeError, OSError, ValueError):
+        return False
+    start = offset
+    try:
+        while True:
+            sent = os.sendfile(out_fd, in_fd, offset, 1 << 30)
+            if sent == 0:
+                return True
+            offset += sent
+    except OSError:
+        if offset != start:
+            raise
+        # 平台不支持复制到普通文件时（尚未写入任何数据），回退为按块复制
+        return False
+
+
+def save_upload_file(src, save_path: str):
+    """将上传文件写入 save_path（摘要已由 calculate_upload_digest 算出，这里只复制）"""
+    with open(save_path, 'wb') as f:
+        # 已落盘的上传文件直接由内核复制，不经过用户态缓冲
+        if sendfile_upload(src, f.fileno()):
+            return
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            f.write(chunk)
 
 
 def get_pdf_page_count(pdf_path: str) -> int:
@@ -205,10 +488,9 @@ def get_pdf_page_count(pdf_path: str) -> int:
         Exception: 如果无法打开或读取 PDF 文件
     """
     try:
-        doc = fitz.open(pdf_path)
-        page_count = doc.page_count
-        doc.close()
-        return page_count
+        # 指定 filetype 跳过文件类型探测；with 保证文档句柄及时关闭
+        with fitz.open(pdf_path, filetype='pdf') as doc:
+            return doc.page_count
     except Exception as e:
         # raise Exception(f"无法计算 PDF 页数: {str(e)}")
         print(f"无法计算 PDF 页数: {pdf_path} {str(e)}")
@@ -229,8 +511,9 @@ def get_client_ip(request: Request) -> str:
     # 优先从 X-Forwarded-For 获取（考虑代理情况）
     forwarded_for = request.headers.get('X-Forwarded-For')
     if forwarded_for:
-        # X-Forwarded-For 可能包含多个 IP，取第一个
-        return forwarded_for.split(',')[0].strip()
+        # X-Forwarded-For 可能包含多个 IP，取第一个（partition 不会构造中间列表）
+        first_ip, _, _ = forwarded_for.partition(',')
+        return first_ip.strip()
     
     # 其次从 X-Real-IP 获取
     real_ip = request.headers.get('X-Real-IP')
@@ -244,6 +527,31 @@ def get_client_ip(request: Request) -> str:
     return 'unknown'
 
 
+# 请求 base_url 缓存：(scheme, Host, server, root_path) -> base_url
+_base_url_cache: Dict[tuple, str] = {}
+
+
+def get_base_url(request: Request) -> str:
+    """
+    获取下载链接使用的 base_url（未配置 OCR_DOWNLOAD_BASE_URL 时从请求中获取）
+    按 Host 等决定 base_url 的字段缓存，同一来源的请求不再重复构造 Starlette URL 对象
+    """
+    if DOWNLOAD_BASE_URL:
+        return DOWNLOAD_BASE_URL
+    scope = request.scope
+    # ASGI 允许 server 为 list（如 TestClient、httpx ASGITransport），转为 tuple 才能作为字典键
+    server = scope.get('server')
+    key = (scope.get('scheme'), request.headers.get('host'), tuple(server) if server else None, scope.get('root_path', ''))
+    base_url = _base_url_cache.get(key)
+    if base_url is None:
+        base_url = str(request.base_url).rstrip('/')
+        # Host 头由客户端控制，限制缓存条目数
+        if len(_base_url_cache) >= 256:
+            _base_url_cache.clear()
+        _base_url_cache[key] = base_url
+    return base_url
+
+
 async def verify_api_key(authorization: Optional[str] = Header(None)) -> Optional[str]:
     """
     验证 Bearer Token 并返回用户标识
@@ -290,63 +598,98 @@ async def verify_api_key(authorization: Optional[str] = Header(None)) -> Optiona
     return user_id
 
 
-def get_lock_for_md5(md5: str) -> FileLock:
-    """为指定的 MD5 获取文件锁"""
+def get_lock_for_md5(md5: str) -> AsyncFileLock:
+    """为指定的 MD5 获取文件锁（异步锁，等待期间不占用线程）"""
     lock_file = os.path.join(WORKSPACE_LOCKS, f"{md5}.lock")
-    return FileLock(lock_file, timeout=300)  # 5分钟超时
+    return AsyncFileLock(lock_file, timeout=300)  # 5分钟超时
 
 
-def save_original_filename(input_dir: str, original_filename: str):
-    """保存原始文件名到 filename.txt"""
+def save_original_filename(input_dir: str, original_filename: str) -> str:
+    """
+    保存原始文件名到 filename.txt（只打开一次：读出已有记录，未记录过时追加）
+    
+    Returns:
+        第一个记录的文件名，省去再次读取
+    
+    读后追加不是原子操作，调用方需持有该 md5 的文件锁
+    """
     filename_file = os.path.join(input_dir, 'filename.txt')
-    # 如果文件已存在，追加新文件名（避免覆盖）
-    mode = 'a' if os.path.exists(filename_file) else 'w'
-    with open(filename_file, mode, encoding='utf-8') as f:
+    # a+ 模式：文件不存在时创建，写入总是追加到末尾（避免覆盖）
+    with open(filename_file, 'a+', encoding='utf-8') as f:
+        f.seek(0)
+        existing_names = f.read().strip().split('\n')
         # 检查是否已记录过该文件名
-        if mode == 'a':
-            with open(filename_file, 'r', encoding='utf-8') as rf:
-                existing_names = rf.read().strip().split('\n')
-                if original_filename in existing_names:
-                    return
-        f.write(original_filename + '\n')
+        if original_filename not in existing_names:
+            f.write(original_filename + '\n')
+    return existing_names[0] or original_filename
 
 
-def get_original_filename(input_dir: str) -> Optional[str]:
-    """读取原始文件名（返回第一个记录的文件名）"""
+def read_original_filenames(input_dir: str) -> list:
+    """读取 filename.txt 中已记录的文件名（只读，无需文件锁；不存在时返回空列表）"""
     filename_file = os.path.join(input_dir, 'filename.txt')
-    if os.path.exists(filename_file):
-        try:
-            with open(filename_file, 'r', encoding='utf-8') as f:
-                first_line = f.readline().strip()
-                return first_line if first_line else None
-        except Exception as e:
-            print(f"读取 filename.txt 失败: {str(e)}")
-    return None
+    try:
+        with open(filename_file, 'r', encoding='utf-8') as f:
+            return [name for name in f.read().split('\n') if name]
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"读取 filename.txt 失败: {str(e)}")
+    return []
 
 
 def get_filename_from_url(pdf_url: str) -> str:
-    """从 URL 中提取文件名"""
-    parsed = urlparse(pdf_url)
-    path = unquote(parsed.path)
-    filename = os.path.basename(path)
+    """从 URL 中提取文件名（只需路径最后一段，用字符串切分代替 urlparse）"""
+    path = pdf_url.partition('#')[0].partition('?')[0]
+    if '://' in path:
+        # 去掉 scheme 和 host，只保留路径部分
+        path = path.partition('://')[2].partition('/')[2]
+    filename = unquote(path).rpartition('/')[2]
     if not filename or not filename.lower().endswith('.pdf'):
         filename = 'document.pdf'
     return filename
 
 
-def download_pdf(pdf_url: str, save_path: str) -> bool:
-    """下载 PDF 文件到指定路径"""
+def raise_pdf_too_large():
+    """PDF 超过 OCR_MAX_PDF_BYTES 时返回 413"""
+    raise HTTPException(status_code=413, detail=f"PDF 文件超过大小上限（{MAX_PDF_BYTES} 字节）")
+
+
+async def download_pdf(pdf_url: str, save_path: str) -> Optional[str]:
+    """
+    下载 PDF 文件到指定路径（异步流式下载，写盘在线程池中执行）
+    下载的同时计算摘要（fingerprint 模式下返回 None）
+    """
     try:
         logger.info(f"开始下载 PDF: {pdf_url}")
-        response = requests.get(pdf_url, stream=True, timeout=300)
-        response.raise_for_status()
-        
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        loop = asyncio.get_event_loop()
+        file_hash = new_file_hasher()
+        async with http_client.stream('GET', pdf_url) as response:
+            response.raise_for_status()
+            
+            # 服务端声明的大小已超过上限时不再下载
+            content_length = response.headers.get('content-length', '')
+            if MAX_PDF_BYTES and content_length.isdigit() and int(content_length) > MAX_PDF_BYTES:
+                raise_pdf_too_large()
+            
+            total = 0
+            with open(save_path, 'wb') as f:
+                def write_chunk(chunk: bytes):
+                    if file_hash:
+                        file_hash.update(chunk)
+                    f.write(chunk)
+                
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    total += len(chunk)
+                    if MAX_PDF_BYTES and total > MAX_PDF_BYTES:
+                        raise_pdf_too_large()
+                    await loop.run_in_executor(None, write_chunk, chunk)
         logger.info(f"PDF 下载成功: {pdf_url} -> {save_path}")
-        return True
-    except requests.exceptions.RequestException as e:
+        return file_hash.hexdigest() if file_hash else None
+    except HTTPException:
+        # 超过大小上限时删除已写入的部分文件
+        Path(save_path).unlink(missing_ok=True)
+        raise
+    except httpx.HTTPError as e:
         logger.error(f"下载 PDF 失败 - URL: {pdf_url}, 错误: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"下载 PDF 失败: {str(e)}")
     except Exception as e:
@@ -354,15 +697,36 @@ def download_pdf(pdf_url: str, save_path: str) -> bool:
         raise HTTPException(status_code=500, detail=f"保存 PDF 失败: {str(e)}")
 
 
-def run_mineru(params: MinerUCommandParams) -> tuple[bool, str]:
+async def read_stream_tail(stream: asyncio.StreamReader, limit: int) -> bytes:
+    """持续读取子进程输出直到结束，只保留最后 limit 字节"""
+    tail = bytearray()
+    while chunk := await stream.read(65536):
+        tail += chunk
+        if len(tail) > limit:
+            del tail[:-limit]
+    return bytes(tail)
+
+
+def kill_process_group(proc: asyncio.subprocess.Process):
+    """强制结束子进程所在的进程组（子进程以 start_new_session 启动，进程组号即其 pid）"""
+    try:
+        if os.name == 'posix':
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def run_mineru(params: MinerUCommandParams) -> tuple[bool, str]:
     """
-    运行 mineru 命令处理 PDF
+    运行 mineru 命令处理 PDF（异步子进程，等待期间不占用线程）
     
     Args:
         params: MinerU 命令参数对象
     
     Returns:
-        (success, message): 执行结果
+        (success, message): 执行结果，message 为输出的末尾部分
     """
     # 使用 MinerUCommandParams 的 to_command_list 方法生成命令
     cmd = params.to_command_list()
@@ -372,22 +736,43 @@ def run_mineru(params: MinerUCommandParams) -> tuple[bool, str]:
     cmd_script = shlex.join(cmd)
     print(f"[MinerU Exec] {cmd_script}")
     
+    proc = None
+    readers = []
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=1800  # 30分钟超时
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # mineru 会启动自己的工作进程，放到独立进程组中，结束时可一并终止
+            start_new_session=(os.name == 'posix')
         )
+        # 同时读取 stdout 和 stderr，避免管道写满导致子进程阻塞
+        readers = [
+            asyncio.create_task(read_stream_tail(proc.stdout, MINERU_OUTPUT_TAIL)),
+            asyncio.create_task(read_stream_tail(proc.stderr, MINERU_OUTPUT_TAIL))
+        ]
+        # proc.wait() 要等管道全部关闭才返回，继承了 stdout/stderr 的残留子进程会让它一直挂起，
+        # 因此直接轮询 mineru 本身的退出码
+        deadline = asyncio.get_running_loop().time() + 1800  # 30分钟超时
+        while proc.returncode is None:
+            if asyncio.get_running_loop().time() >= deadline:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(MINERU_POLL_INTERVAL)
+        returncode = proc.returncode
+        # mineru 已退出，结束进程组中的残留子进程，再在短暂宽限期内收集输出
+        kill_process_group(proc)
+        done, _ = await asyncio.wait(readers, timeout=MINERU_READER_GRACE)
+        stdout = (readers[0].result() if readers[0] in done else b'').decode('utf-8', errors='replace')
+        stderr = (readers[1].result() if readers[1] in done else b'').decode('utf-8', errors='replace')
         
-        if result.returncode == 0:
+        if returncode == 0:
             logger.info(f"MinerU 执行成功: {params.path}")
-            return True, result.stdout
+            return True, stdout
         else:
-            error_msg = f"mineru 执行失败: {result.stderr}"
-            logger.error(f"MinerU 执行失败 - 命令: {cmd_script}, 返回码: {result.returncode}, 错误: {result.stderr}")
+            error_msg = f"mineru 执行失败: {stderr}"
+            logger.error(f"MinerU 执行失败 - 命令: {cmd_script}, 返回码: {returncode}, 错误: {stderr}")
             return False, error_msg
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         error_msg = "mineru 执行超时（30分钟）"
         logger.error(f"MinerU 执行超时 - 命令: {cmd_script}, 文件: {params.path}")
         return False, error_msg
@@ -399,158 +784,426 @@ def run_mineru(params: MinerUCommandParams) -> tuple[bool, str]:
         error_msg = f"执行 mineru 时发生错误: {str(e)}"
         logger.error(f"MinerU 执行异常 - 命令: {cmd_script}, 错误: {str(e)}", exc_info=True)
         return False, error_msg
+    finally:
+        # 超时或请求被取消时结束整个进程组（包括 mineru 启动的工作进程）
+        if proc is not None and proc.returncode is None:
+            kill_process_group(proc)
+            await proc.wait()
+        for reader in readers:
+            reader.cancel()
+
+
+def check_mineru_queue(filename: str):
+    """排队任务数达到 OCR_QUEUE_LIMIT 时直接返回 429，避免请求无限堆积"""
+    if mineru_semaphore.locked() and MINERU_QUEUE_LIMIT and mineru_waiting >= MINERU_QUEUE_LIMIT:
+        logger.warning(f"mineru 排队任务已满 - 排队数: {mineru_waiting}, 文件: {filename}")
+        raise HTTPException(
+            status_code=429,
+            detail="处理任务过多，请稍后重试",
+            headers={"Retry-After": str(MINERU_RETRY_AFTER)}
+        )
 
 
-def get_output_files(output_dir: str) -> list:
-    """获取输出目录下的所有文件"""
+async def run_mineru_limited(params: MinerUCommandParams) -> tuple[bool, str]:
+    """
+    在并发限制内运行 mineru，名额用完时排队等待
+    排队任务数达到 OCR_QUEUE_LIMIT 时直接返回 429，避免请求无限堆积
+    """
+    global mineru_waiting
+    check_mineru_queue(params.path)
+    
+    mineru_waiting += 1
+    try:
+        await mineru_semaphore.acquire()
+    finally:
+        mineru_waiting -= 1
+    try:
+        return await run_mineru(params)
+    finally:
+        mineru_semaphore.release()
+
+
+def iter_dir_files(top: str, rel_dir: str = ''):
+    """
+    使用 os.scandir 递归遍历目录下的文件，产出 (DirEntry, 相对 top 的路径)
+    顺序与 os.walk 相同（先当前目录的文件，再子目录），不进入指向目录的符号链接；
+    相对路径在遍历时拼接，无需对每个文件调用 os.path.relpath
+    """
+    try:
+        with os.scandir(top) as it:
+            entries = list(it)
+    except OSError:
+        return
+    sub_dirs = []
+    for entry in entries:
+        rel_path = rel_dir + entry.name
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            yield entry, rel_path
+        elif not entry.is_symlink():
+            sub_dirs.append((entry.path, rel_path + os.sep))
+    for sub_dir, sub_rel_dir in sub_dirs:
+        yield from iter_dir_files(sub_dir, sub_rel_dir)
+
+
+def scan_output(output_dir: str, md5: str = '') -> tuple[list, Optional[str]]:
+    """
+    遍历一次输出目录，同时得到文件列表和 markdown 文件路径
+    markdown 优先取 {md5}.md，找不到时取第一个 .md 文件
+    
+    Returns:
+        (files, md_path)，md_path 为相对 output_dir 的路径，没有 .md 文件时为 None
+    """
     files = []
-    if os.path.exists(output_dir):
-        for root, _, filenames in os.walk(output_dir):
-            for filename in filenames:
-                file_path = os.path.join(root, filename)
-                rel_path = os.path.relpath(file_path, output_dir)
-                files.append({
-                    'name': filename,
-                    'path': rel_path,
-                    'size': os.path.getsize(file_path)
-                })
-    return files
+    target_md = f"{md5}.md"
+    md_path = None
+    first_md_path = None
+    for entry, rel_path in iter_dir_files(output_dir):
+        # 跳过处理完成标记（及其写入中的临时文件）
+        if rel_path == entry.name and entry.name.startswith(DONE_MARKER):
+            continue
+        files.append({
+            'name': entry.name,
+            'path': rel_path,
+            'size': entry.stat().st_size
+        })
+        if entry.name.endswith('.md'):
+            if md_path is None and entry.name == target_md:
+                md_path = rel_path
+            if first_md_path is None:
+                first_md_path = rel_path
+    return files, md_path or first_md_path
+
+
+def get_output_files(output_dir: str) -> list:
+    """获取输出目录下的所有文件（已完成的任务直接读取完成标记中的文件列表，不遍历目录）"""
+    marker = load_done_marker(output_dir)
+    if marker is not None:
+        return marker['files']
+    return scan_output(output_dir)[0]
 
 
 def generate_download_urls(md5: str, files: list, base_url: str) -> dict:
     """生成文件下载链接"""
-    urls = {}
-    for file_info in files:
-        rel_path = f"output/{md5}/{file_info['path']}"
-        encoded_path = quote(rel_path, safe='/')
-        urls[file_info['name']] = f"{base_url}/files/{encoded_path}"
-    return urls
+    # 公共前缀只编码一次，循环中只对文件的相对路径编码
+    prefix = f"{base_url}/files/{quote(f'output/{md5}/', safe='/')}"
+    return {
+        file_info['name']: prefix + quote(file_info['path'], safe='/')
+        for file_info in files
+    }
+
+
+# markdown 内容缓存（LRU）：路径 -> (mtime_ns, 文件大小, 内容)，在线程池中访问，需加锁
+_md_cache: OrderedDict = OrderedDict()
+_md_cache_bytes = 0
+_md_cache_lock = threading.Lock()
 
 
-def read_md_content(output_dir: str, md5: str) -> Optional[str]:
+def _cached_md_content(md_path: str, mtime_ns: int, size: int) -> str:
     """
-    读取 markdown 文件内容并返回。
-    统一查找 {md5}.md 文件，如果找不到则返回第一个找到的 .md 文件。
+    按路径缓存 markdown 内容，mtime/size 变化（重新处理）即重新读取
+    总大小超过 MD_CACHE_MAX_BYTES 时淘汰最久未使用的条目；超过 MD_CACHE_MAX_ENTRY_BYTES 的文档不缓存
     """
-    if not os.path.exists(output_dir):
+    global _md_cache_bytes
+    with _md_cache_lock:
+        cached = _md_cache.get(md_path)
+        if cached and cached[0] == mtime_ns and cached[1] == size:
+            _md_cache.move_to_end(md_path)
+            return cached[2]
+    
+    # 一次读出全部字节再解码，不经过文本模式的逐块解码和换行转换
+    content = Path(md_path).read_bytes().decode('utf-8')
+    if size > MD_CACHE_MAX_ENTRY_BYTES:
+        return content
+    
+    with _md_cache_lock:
+        old = _md_cache.pop(md_path, None)
+        if old:
+            _md_cache_bytes -= old[1]
+        _md_cache[md_path] = (mtime_ns, size, content)
+        _md_cache_bytes += size
+        while _md_cache_bytes > MD_CACHE_MAX_BYTES:
+            _, evicted = _md_cache.popitem(last=False)
+            _md_cache_bytes -= evicted[1]
+    return content
+
+
+def read_md_content(output_dir: str, md_path: Optional[str]) -> Optional[str]:
+    """读取 markdown 文件内容并返回，md_path 为相对 output_dir 的路径（来自完成标记）"""
+    if not md_path:
         return None
     
-    # 优先查找以 md5 命名的 md 文件
-    target_md = f"{md5}.md"
-    first_md_path = None
+    md_path = os.path.join(output_dir, md_path)
+    try:
+        # 热点文档重复命中时只需一次 stat，不再读取文件
+        st = os.stat(md_path)
+        return _cached_md_content(md_path, st.st_mtime_ns, st.st_size)
+    except Exception as e:
+        print(f"读取文件 {md_path} 失败: {str(e)}")
+    return None
 
-    for root, _, filenames in os.walk(output_dir):
-        for filename in filenames:
-            if filename.endswith('.md'):
-                file_path = os.path.join(root, filename)
-                
-                # 记录第一个找到的 md 文件路径，作为兜底
-                if first_md_path is None:
-                    first_md_path = file_path
-
-                # 优先匹配 md5 命名的文件
-                if filename == target_md:
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            return f.read()
-                    except Exception as e:
-                        print(f"读取文件 {file_path} 失败: {str(e)}")
-                        pass
-
-    # 如果没找到 md5.md，返回第一个找到的 md 文件
-    if first_md_path:
-        try:
-            with open(first_md_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except Exception as e:
-            print(f"读取文件 {first_md_path} 失败: {str(e)}")
-    
+
+def load_done_marker(output_dir: str) -> Optional[dict]:
+    """读取处理完成标记，不存在或内容损坏时返回 None"""
+    try:
+        with open(os.path.join(output_dir, DONE_MARKER), 'r', encoding='utf-8') as f:
+            marker = json.load(f)
+        if isinstance(marker, dict) and isinstance(marker.get('files'), list):
+            return marker
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"读取完成标记失败: {output_dir} {str(e)}")
     return None
 
 
-def _process_pdf_task(
+def save_done_marker(output_dir: str, md5: str, scanned: Optional[tuple] = None) -> dict:
+    """
+    写入处理完成标记，之后的缓存命中无需再遍历输出目录
+    scanned 为 scan_output 的结果，未提供时重新扫描输出目录
+    先写临时文件再 os.replace，避免并发读取到不完整的标记
+    """
+    files, md_path = scanned or scan_output(output_dir, md5)
+    marker = {
+        'files': files,
+        'md_path': md_path,
+        # 页数只在写入标记时计算一次，缓存命中时无需再打开 PDF
+        'pdf_pages': get_pdf_page_count(os.path.join(WORKSPACE_INPUT, md5, f"{md5}.pdf"))
+    }
+    marker_path = os.path.join(output_dir, DONE_MARKER)
+    temp_marker_path = f"{marker_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_marker_path, 'w', encoding='utf-8') as f:
+            json.dump(marker, f, ensure_ascii=False)
+        os.replace(temp_marker_path, marker_path)
+    except Exception as e:
+        Path(temp_marker_path).unlink(missing_ok=True)
+        print(f"写入完成标记失败: {output_dir} {str(e)}")
+    return marker
+
+
+def get_url_cache_path(pdf_url: str) -> str:
+    """URL 映射缓存文件路径（以 URL 的 SHA-256 命名）"""
+    url_hash = hashlib.sha256(pdf_url.encode('utf-8')).hexdigest()
+    return os.path.join(WORKSPACE_URL_CACHE, f"{url_hash}.json")
+
+
+def load_url_md5(pdf_url: str) -> Optional[str]:
+    """读取 URL 对应的文件摘要，未启用、不存在、已过期或哈希算法不同时返回 None"""
+    if URL_CACHE_TTL <= 0:
+        return None
+    try:
+        with open(get_url_cache_path(pdf_url), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        if entry.get('hash_alg') == HASH_ALG and time.time() - entry.get('fetched_at', 0) < URL_CACHE_TTL:
+            return entry.get('md5')
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"读取 URL 缓存失败: {pdf_url} {str(e)}")
+    return None
+
+
+def save_url_md5(pdf_url: str, md5: str):
+    """记录 URL 对应的文件摘要（先写临时文件再 os.replace）"""
+    if URL_CACHE_TTL <= 0:
+        return
+    cache_path = get_url_cache_path(pdf_url)
+    temp_cache_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'url': pdf_url, 'md5': md5, 'hash_alg': HASH_ALG, 'fetched_at': time.time()}, f, ensure_ascii=False)
+        os.replace(temp_cache_path, cache_path)
+    except Exception as e:
+        Path(temp_cache_path).unlink(missing_ok=True)
+        print(f"写入 URL 缓存失败: {pdf_url} {str(e)}")
+
+
+def _build_cached_response(md5: str, filename: str, base_url: str) -> tuple:
+    """
+    直接按摘要返回已处理的结果（同步，在线程池中执行，不获取文件锁）
+    只读取 filename.txt，不写入；需要追加文件名时由 get_cached_response 在文件锁内完成
+    
+    Returns:
+        (response, recorded)：输入文件或完成标记不存在时 response 为 None；
+        recorded 表示 filename 是否已记录在 filename.txt 中
+    """
+    input_dir = os.path.join(WORKSPACE_INPUT, md5)
+    input_pdf_path = os.path.join(input_dir, f"{md5}.pdf")
+    output_dir = os.path.join(WORKSPACE_OUTPUT, md5)
+    
+    marker = load_done_marker(output_dir)
+    if marker is None or not os.path.exists(input_pdf_path):
+        return None, False
+    
+    recorded_names = read_original_filenames(input_dir)
+    original_filename = recorded_names[0] if recorded_names else filename
+    response = _build_task_response(
+        md5,
+        input_pdf_path,
+        output_dir,
+        marker,
+        base_url,
+        f"文件已处理过，直接返回结果（原始文件名: {original_filename}）"
+    )
+    return response, filename in recorded_names
+
+
+async def get_cached_response(md5: str, filename: str, base_url: str) -> Optional[MinerUResponse]:
+    """
+    已处理过的文件直接返回结果（URL 缓存命中、上传及处理任务的快速路径使用）
+    文件名已记录时完全不获取文件锁；新文件名在文件锁内追加，避免并发请求重复写入
+    """
+    loop = asyncio.get_event_loop()
+    response, recorded = await loop.run_in_executor(executor, _build_cached_response, md5, filename, base_url)
+    if response is not None and not recorded:
+        async with get_lock_for_md5(md5):
+            await loop.run_in_executor(
+                None, save_original_filename, os.path.join(WORKSPACE_INPUT, md5), filename
+            )
+    return response
+
+
+def _prepare_task_files(temp_pdf_path: str, md5: str, filename: str) -> tuple:
+    """
+    将临时文件移动到正式目录并检查是否已处理（同步，在持有文件锁时于线程池中执行）
+    
+    Returns:
+        (input_pdf_path, output_dir, marker, original_filename)，未处理过时 marker 为 None
+    """
+    # 创建基于 MD5 的输入目录
+    input_dir = os.path.join(WORKSPACE_INPUT, md5)
+    os.makedirs(input_dir, exist_ok=True)
+    
+    # 统一使用 md5.pdf 作为文件名
+    input_pdf_path = os.path.join(input_dir, f"{md5}.pdf")
+    
+    # 保存原始文件名（返回第一个记录的文件名，用于日志）
+    original_filename = save_original_filename(input_dir, filename)
+    
+    # 移动文件到正式目录（temp 与正式目录位于同一文件系统，os.replace 为原子操作）
+    # 文件已存在时内容相同（摘要一致），直接覆盖，省去 exists 检查和删除临时文件
+    os.replace(temp_pdf_path, input_pdf_path)
+    
+    # 输出目录
+    output_dir = os.path.join(WORKSPACE_OUTPUT, md5)
+    
+    # 检查是否已处理过（存在完成标记）
+    marker = load_done_marker(output_dir)
+    if marker is None:
+        scanned = scan_output(output_dir, md5)
+        if scanned[1]:
+            # 没有完成标记但已有 .md 文件（旧版本的处理结果），用本次扫描结果补写标记
+            marker = save_done_marker(output_dir, md5, scanned)
+
+    if marker is None:
+        # 创建输出目录
+        os.makedirs(output_dir, exist_ok=True)
+        return input_pdf_path, output_dir, None, filename
+
+    return input_pdf_path, output_dir, marker, original_filename
+
+
+def _discard_task_files(md5: str):
+    """删除未处理任务的输入目录和输出目录（同步，在持有文件锁时于线程池中执行）"""
+    shutil.rmtree(os.path.join(WORKSPACE_INPUT, md5), ignore_errors=True)
+    shutil.rmtree(os.path.join(WORKSPACE_OUTPUT, md5), ignore_errors=True)
+
+
+def _build_task_response(
+    md5: str,
+    input_pdf_path: str,
+    output_dir: str,
+    marker: dict,
+    base_url: str,
+    message: str
+) -> MinerUResponse:
+    """根据完成标记生成成功响应（读取 md 内容，同步，在线程池中执行）"""
+    files = marker['files']
+    download_urls = generate_download_urls(md5, files, base_url)
+    md_content = read_md_content(output_dir, marker.get('md_path'))
+    
+    response = MinerUResponse(
+        success=True,
+        message=message,
+        md5=md5,
+        input_path=input_pdf_path,
+        output_path=output_dir,
+        files=files,
+        download_urls=download_urls
+    )
+    # 统一使用 md5.md 作为动态字段名
+    if md_content:
+        setattr(response, f"{md5}.md", md_content)
+    return response
+
+
+async def _process_pdf_task(
     temp_pdf_path: str, 
     filename: str, 
     base_url: str,
-    mineru_params: MinerUCommandParams
+    mineru_params: MinerUCommandParams,
+    md5: Optional[str] = None
 ) -> MinerUResponse:
     """
     核心处理逻辑（带并发保护）：
-    1. 计算 MD5
+    1. 计算 MD5（已有完成标记时直接返回结果，不获取文件锁）
     2. 获取文件锁（防止并发处理同一文件）
     3. 移动文件到正式目录（统一使用 md5.pdf 命名）
     4. 检查是否已处理
     5. 运行 mineru
     6. 返回结果
     
+    文件操作在线程池中执行，mineru 以异步子进程运行，等待期间不占用线程
+    
     Args:
         temp_pdf_path: 临时 PDF 文件路径
         filename: 原始文件名（用于记录）
         base_url: 下载基础 URL
         mineru_params: MinerU 命令参数（注意：path 和 output 会被重新设置）
+        md5: 保存文件时已算出的摘要，为 None 时重新读取文件计算
     """
-    # 计算 MD5
-    md5 = calculate_file_md5(temp_pdf_path)
-    
-    # 获取文件锁，防止并发处理同一个 MD5
-    lock = get_lock_for_md5(md5)
-    
+    loop = asyncio.get_event_loop()
     try:
-        with lock:
-            pdf_pages = get_pdf_page_count(temp_pdf_path)
+        # 计算文件摘要（默认 MD5）
+        if not md5:
+            md5 = await loop.run_in_executor(executor, calculate_file_digest, temp_pdf_path)
+        
+        # 快速路径：完成标记在 mineru 成功后才原子写入，存在即说明已处理完成，无需获取文件锁
+        cached = await get_cached_response(md5, filename, base_url)
+        if cached is not None:
+            await loop.run_in_executor(None, Path(temp_pdf_path).unlink, True)
+            return cached
+        
+        # 排队已满时在移动文件、获取文件锁之前拒绝，不留下永远处于 pending 的任务
+        try:
+            check_mineru_queue(filename)
+        except HTTPException:
+            await loop.run_in_executor(None, Path(temp_pdf_path).unlink, True)
+            raise
+        
+        # 获取文件锁，防止并发处理同一个 MD5
+        lock = get_lock_for_md5(md5)
+        
+        async with lock:
+            input_pdf_path, output_dir, marker, original_filename = await loop.run_in_executor(
+                executor, _prepare_task_files, temp_pdf_path, md5, filename
+            )
 
-            # 创建基于 MD5 的输入目录
-            input_dir = os.path.join(WORKSPACE_INPUT, md5)
-            os.makedirs(input_dir, exist_ok=True)
-            
-            # 统一使用 md5.pdf 作为文件名
-            input_pdf_path = os.path.join(input_dir, f"{md5}.pdf")
-            
-            # 保存原始文件名
-            save_original_filename(input_dir, filename)
-            
-            # 移动文件到正式目录
-            if os.path.exists(input_pdf_path):
-                os.remove(temp_pdf_path)  # 文件已存在，删除临时文件
-            else:
-                os.rename(temp_pdf_path, input_pdf_path)
-            
-            # 输出目录
-            output_dir = os.path.join(WORKSPACE_OUTPUT, md5)
-            
-            # 检查是否已处理过（输出目录存在且有 .md 文件）
-            is_cached = False
-            if os.path.exists(output_dir) and any(
-                f.endswith('.md') 
-                for root, dirs, files in os.walk(output_dir) 
-                for f in files
-            ):
-                is_cached = True
-
-            if is_cached:
-                files = get_output_files(output_dir)
-                download_urls = generate_download_urls(md5, files, base_url)
-                md_content = read_md_content(output_dir, md5)
-                
-                # 获取原始文件名用于日志
-                original_filename = get_original_filename(input_dir) or filename
-                
-                response = MinerUResponse(
-                    success=True,
-                    message=f"文件已处理过，直接返回结果（原始文件名: {original_filename}）",
-                    md5=md5,
-                    input_path=input_pdf_path,
-                    output_path=output_dir,
-                    files=files,
-                    download_urls=download_urls
+            if marker is not None:
+                return await loop.run_in_executor(
+                    executor,
+                    _build_task_response,
+                    md5,
+                    input_pdf_path,
+                    output_dir,
+                    marker,
+                    base_url,
+                    f"文件已处理过，直接返回结果（原始文件名: {original_filename}）"
                 )
-                # 统一使用 md5.md 作为动态字段名
-                if md_content:
-                    setattr(response, f"{md5}.md", md_content)
-                return response
-            
-            # 创建输出目录
-            os.makedirs(output_dir, exist_ok=True)
             
             # 更新 mineru 参数中的路径
             mineru_params.path = input_pdf_path
@@ -558,7 +1211,12 @@ def _process_pdf_task(
             
             # 运行 mineru
             print(f"[MinerU] 开始处理文件: {filename} (MD5: {md5})")
-            success, message = run_mineru(mineru_params)
+            try:
+                success, message = await run_mineru_limited(mineru_params)
+            except HTTPException:
+                # 等待文件锁期间排队已满被拒绝：删除本次移入的输入文件和输出目录
+                await loop.run_in_executor(executor, _discard_task_files, md5)
+                raise
             
             if not success:
                 return MinerUResponse(
@@ -569,29 +1227,22 @@ def _process_pdf_task(
                     output_path=output_dir
                 )
             
-            # 获取输出文件列表
-            files = get_output_files(output_dir)
-            download_urls = generate_download_urls(md5, files, base_url)
-            md_content = read_md_content(output_dir, md5)
-            
-            response = MinerUResponse(
-                success=True,
-                message=f"处理成功（原始文件名: {filename}）",
-                md5=md5,
-                input_path=input_pdf_path,
-                output_path=output_dir,
-                files=files,
-                download_urls=download_urls
+            # 获取输出文件列表，并写入完成标记
+            marker = await loop.run_in_executor(executor, save_done_marker, output_dir, md5)
+            return await loop.run_in_executor(
+                executor,
+                _build_task_response,
+                md5,
+                input_pdf_path,
+                output_dir,
+                marker,
+                base_url,
+                f"处理成功（原始文件名: {filename}）"
             )
-            # 统一使用 md5.md 作为动态字段名
-            if md_content:
-                setattr(response, f"{md5}.md", md_content)
-            return response
-            
+        
     except Timeout:
         # 清理临时文件
-        if os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)
+        Path(temp_pdf_path).unlink(missing_ok=True)
         error_msg = f"文件正在被其他请求处理，请稍后重试（MD5: {md5}）"
         logger.warning(f"文件锁超时 - MD5: {md5}, 文件名: {filename}")
         raise HTTPException(status_code=409, detail=error_msg)
@@ -600,8 +1251,7 @@ def _process_pdf_task(
         raise
     except Exception as e:
         # 清理临时文件
-        if os.path.exists(temp_pdf_path):
-            os.remove(temp_pdf_path)
+        Path(temp_pdf_path).unlink(missing_ok=True)
         error_msg = f"处理 PDF 任务时发生错误: {str(e)}"
         logger.error(f"处理 PDF 任务异常 - MD5: {md5}, 文件名: {filename}, 错误: {str(e)}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=error_msg)
@@ -643,7 +1293,7 @@ async def mineru_endpoint(
     logger.info(f"[API Request] /mineru - {user_info}, IP: {client_ip}, Body: pdf_url={body.pdf_url}, pdf_path={body.pdf_path}")
     
     # 获取请求的 base_url
-    base_url = DOWNLOAD_BASE_URL or str(request.base_url).rstrip('/')
+    base_url = get_base_url(request)
     
     # 验证参数
     if not body.pdf_url and not body.pdf_path:
@@ -655,17 +1305,18 @@ async def mineru_endpoint(
         raise HTTPException(status_code=400, detail="只能提供 pdf_url 或 pdf_path 其中一个")
     
     try:
-        # 创建临时目录
-        temp_dir = os.path.join(WORKSPACE_INPUT, 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
+        # 复制、下载等文件 I/O 放到默认线程池执行，不阻塞事件循环；
+        # executor 留给处理任务，避免任务较多时这些操作排队等待
+        loop = asyncio.get_event_loop()
         
         # 生成唯一的临时文件名，避免并发冲突
         temp_filename = f"{uuid.uuid4().hex}.pdf"
-        temp_pdf_path = os.path.join(temp_dir, temp_filename)
+        temp_pdf_path = os.path.join(WORKSPACE_TEMP, temp_filename)
         
         # 处理本地文件路径
         if body.pdf_path:
-            if not os.path.exists(body.pdf_path):
+            # pdf_path 可能位于网络存储上，stat 同样放到线程池执行
+            if not await loop.run_in_executor(None, os.path.exists, body.pdf_path):
                 logger.error(f"[API Request] /mineru - 文件不存在: {body.pdf_path}, IP: {client_ip}")
                 raise HTTPException(status_code=404, detail=f"文件不存在: {body.pdf_path}")
             
@@ -675,9 +1326,19 @@ async def mineru_endpoint(
             
             filename = body.pdf_filename or os.path.basename(body.pdf_path)
             
-            # 复制文件到临时目录
+            # 计算源文件摘要（批量任务重复提交同一文件时命中缓存，无需重新读取）
+            md5 = await loop.run_in_executor(executor, get_local_file_digest, body.pdf_path)
+            
+            # 已处理过的文件直接返回结果，无需复制
+            cached = await get_cached_response(md5, filename, base_url)
+            if cached is not None:
+                logger.info(f"处理任务完成 - 文件: {filename}, MD5: {md5}, 缓存命中, IP: {client_ip}")
+                return cached
+            
+            # 复制文件到临时目录（不使用硬链接：用户文件之后被原地修改时，
+            # 会连带改变 input/<md5>/ 中已按旧摘要保存的文件）
             try:
-                shutil.copy2(body.pdf_path, temp_pdf_path)
+                await loop.run_in_executor(None, shutil.copy2, body.pdf_path, temp_pdf_path)
                 logger.info(f"本地文件复制成功: {body.pdf_path} -> {temp_pdf_path}")
             except Exception as e:
                 logger.error(f"复制本地文件失败 - 源: {body.pdf_path}, 目标: {temp_pdf_path}, 错误: {str(e)}", exc_info=True)
@@ -686,8 +1347,16 @@ async def mineru_endpoint(
             # 处理 URL 下载
             filename = body.pdf_filename or get_filename_from_url(body.pdf_url)
             
+            # 有效期内请求过同一 URL 且已处理完成时，直接返回结果，不再下载
+            cached_md5 = await loop.run_in_executor(None, load_url_md5, body.pdf_url)
+            if cached_md5:
+                result = await get_cached_response(cached_md5, filename, base_url)
+                if result:
+                    logger.info(f"URL 缓存命中 - URL: {body.pdf_url}, MD5: {cached_md5}, IP: {client_ip}")
+                    return result
+            
             # 下载 PDF
-            download_pdf(body.pdf_url, temp_pdf_path)
+            md5 = await download_pdf(body.pdf_url, temp_pdf_path)
         
         # 创建 MinerU 命令参数
         mineru_params = MinerUCommandParams(
@@ -700,18 +1369,18 @@ async def mineru_endpoint(
             table=body.table if body.table is not None else True
         )
         
-        # 使用线程池异步执行处理任务
-        logger.info(f"提交处理任务到线程池 - 文件: {filename}, IP: {client_ip}")
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            _process_pdf_task,
+        # 执行处理任务（文件操作在线程池中执行，mineru 以异步子进程运行）
+        logger.info(f"开始处理任务 - 文件: {filename}, IP: {client_ip}")
+        result = await _process_pdf_task(
             temp_pdf_path,
             filename,
             base_url,
-            mineru_params
+            mineru_params,
+            md5
         )
         logger.info(f"处理任务完成 - 文件: {filename}, MD5: {result.md5}, 成功: {result.success}, IP: {client_ip}")
+        if body.pdf_url and result.success:
+            await loop.run_in_executor(None, save_url_md5, body.pdf_url, result.md5)
         return result
     except HTTPException:
         raise
@@ -745,7 +1414,7 @@ async def file_mineru_endpoint(
     user_info = f"User: {api_key}" if api_key else "No Auth"
     logger.info(f"[API Request] /file_mineru - {user_info}, IP: {client_ip}, File: {file.filename}")
     
-    base_url = DOWNLOAD_BASE_URL or str(request.base_url).rstrip('/')
+    base_url = get_base_url(request)
     
     # 验证文件类型
     if not file.filename:
@@ -756,22 +1425,31 @@ async def file_mineru_endpoint(
         logger.warning(f"[API Request] /file_mineru - 文件类型错误: {file.filename}, IP: {client_ip}")
         raise HTTPException(status_code=400, detail="只支持 PDF 文件")
 
+    # 上传内容已由 Starlette 缓存到临时文件，超过大小上限时不再计算摘要和写入工作目录
+    if MAX_PDF_BYTES and file.size is not None and file.size > MAX_PDF_BYTES:
+        logger.warning(f"[API Request] /file_mineru - 文件过大: {file.filename}, 大小: {file.size}, IP: {client_ip}")
+        raise_pdf_too_large()
+
     filename = pdf_filename or file.filename
 
     try:
-        # 创建临时目录
-        temp_dir = os.path.join(WORKSPACE_INPUT, 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        
         # 使用 UUID 生成唯一的临时文件名，避免并发冲突
         temp_filename = f"{uuid.uuid4().hex}.pdf"
-        temp_pdf_path = os.path.join(temp_dir, temp_filename)
+        temp_pdf_path = os.path.join(WORKSPACE_TEMP, temp_filename)
         
+        loop = asyncio.get_event_loop()
         try:
+            # 先直接对上传内容计算摘要，已处理过的文件无需写入 temp 目录
+            md5 = await loop.run_in_executor(executor, calculate_upload_digest, file.file)
+            cached = await get_cached_response(md5, filename, base_url)
+            if cached is not None:
+                logger.info(f"处理任务完成 - 文件: {filename}, MD5: {md5}, 缓存命中, IP: {client_ip}")
+                return cached
+            
             # 保存上传的文件
             logger.info(f"开始保存上传文件: {filename} -> {temp_pdf_path}")
-            with open(temp_pdf_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            # 文件 I/O 放到默认线程池执行，executor 留给处理任务
+            await loop.run_in_executor(None, save_upload_file, file.file, temp_pdf_path)
             logger.info(f"文件保存成功: {temp_pdf_path}")
         except Exception as e:
             logger.error(f"保存上传文件失败 - 文件: {filename}, 路径: {temp_pdf_path}, 错误: {str(e)}", exc_info=True)
@@ -790,16 +1468,14 @@ async def file_mineru_endpoint(
             table=table if table is not None else True
         )
         
-        # 使用线程池异步执行处理任务
-        logger.info(f"提交处理任务到线程池 - 文件: {filename}, IP: {client_ip}")
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            executor,
-            _process_pdf_task,
+        # 执行处理任务（文件操作在线程池中执行，mineru 以异步子进程运行）
+        logger.info(f"开始处理任务 - 文件: {filename}, IP: {client_ip}")
+        result = await _process_pdf_task(
             temp_pdf_path,
             filename,
             base_url,
-            mineru_params
+            mineru_params,
+            md5
         )
         logger.info(f"处理任务完成 - 文件: {filename}, MD5: {result.md5}, 成功: {result.success}, IP: {client_ip}")
         return result
@@ -810,23 +1486,32 @@ async def file_mineru_endpoint(
         raise HTTPException(status_code=500, detail=f"处理请求时发生错误: {str(e)}")
 
 
+def list_dir_names(path: str) -> list:
+    """使用 os.scandir 列出目录下的条目名（目录不存在时抛出 FileNotFoundError）"""
+    with os.scandir(path) as it:
+        return [entry.name for entry in it]
+
+
 @app.get("/status/{md5}")
 async def get_status(md5: str, request: Request):
     """查询处理状态和结果"""
     # 获取请求的 base_url
-    base_url = DOWNLOAD_BASE_URL or str(request.base_url).rstrip('/')
+    base_url = get_base_url(request)
     
     input_dir = os.path.join(WORKSPACE_INPUT, md5)
     output_dir = os.path.join(WORKSPACE_OUTPUT, md5)
     
-    if not os.path.exists(input_dir):
-        raise HTTPException(status_code=404, detail="未找到对应的任务")
+    # 目录遍历放到默认线程池执行，不阻塞事件循环
+    loop = asyncio.get_event_loop()
     
-    # 获取输入文件
-    input_files = os.listdir(input_dir) if os.path.exists(input_dir) else []
+    # 获取输入文件（目录不存在即任务不存在，省去单独的 exists 检查）
+    try:
+        input_files = await loop.run_in_executor(None, list_dir_names, input_dir)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="未找到对应的任务")
     
     # 获取输出文件
-    output_files = get_output_files(output_dir) if os.path.exists(output_dir) else []
+    output_files = await loop.run_in_executor(None, get_output_files, output_dir)
     download_urls = generate_download_urls(md5, output_files, base_url) if output_files else {}
     
     return {
@@ -838,35 +1523,66 @@ async def get_status(md5: str, request: Request):
     }
 
 
-@app.get("/list")
-async def list_tasks(
-    type: str = Query("all", description="类型: input, output, all")
-):
-    """列出所有任务"""
+# 任务目录列表缓存：目录路径 -> (目录 mtime_ns, 子目录名列表)
+_task_dirs_cache: Dict[str, tuple] = {}
+
+
+def list_task_dirs(root: str, exclude: tuple = ()) -> list:
+    """
+    使用 os.scandir 列出 root 下的任务目录（DirEntry.is_dir 通常无需额外 stat）
+    新增或删除子目录会更新 root 的 mtime，mtime 未变化时直接返回上次的结果
+    """
+    try:
+        mtime_ns = os.stat(root).st_mtime_ns
+    except OSError:
+        return []
+    cached = _task_dirs_cache.get(root)
+    if cached and cached[0] == mtime_ns:
+        return list(cached[1])
+    
+    with os.scandir(root) as it:
+        tasks = [entry.name for entry in it if entry.name not in exclude and entry.is_dir()]
+    # mtime 在 1 秒内的目录可能在同一时间戳内还会变化（文件系统时间戳精度有限），暂不缓存
+    if time.time_ns() - mtime_ns > 1_000_000_000:
+        _task_dirs_cache[root] = (mtime_ns, tasks)
+    return list(tasks)
+
+
+def _list_tasks(type: str) -> dict:
+    """列出 input / output 目录下的任务（同步，在线程池中执行）"""
     result = {}
     
     if type in ["input", "all"]:
-        input_tasks = []
-        if os.path.exists(WORKSPACE_INPUT):
-            for md5 in os.listdir(WORKSPACE_INPUT):
-                if md5 != 'temp' and os.path.isdir(os.path.join(WORKSPACE_INPUT, md5)):
-                    input_tasks.append(md5)
-        result["input_tasks"] = input_tasks
+        result["input_tasks"] = list_task_dirs(WORKSPACE_INPUT, exclude=('temp',))
     
     if type in ["output", "all"]:
-        output_tasks = []
-        if os.path.exists(WORKSPACE_OUTPUT):
-            for md5 in os.listdir(WORKSPACE_OUTPUT):
-                if os.path.isdir(os.path.join(WORKSPACE_OUTPUT, md5)):
-                    output_tasks.append(md5)
-        result["output_tasks"] = output_tasks
+        result["output_tasks"] = list_task_dirs(WORKSPACE_OUTPUT)
     
     return result
 
 
+@app.get("/list")
+async def list_tasks(
+    type: str = Query("all", description="类型: input, output, all")
+):
+    """列出所有任务"""
+    # 目录遍历放到默认线程池执行，不阻塞事件循环
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, _list_tasks, type)
+
+
 if __name__ == "__main__":
-    # reload=True 启用热重载，代码修改后自动重启
-    uvicorn.run("services.apis_ocr:app", host=SERVER_HOST, port=SERVER_PORT, reload=True)
+    # loop/http 使用 auto：已安装 uvloop、httptools（uvicorn[standard]）时自动使用，
+    # 未安装时（如 Windows）回退到 asyncio 和 h11；热重载仅在开发模式下启用
+    uvicorn.run(
+        "services.apis_ocr:app",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        loop="auto",
+        http="auto",
+        workers=SERVER_WORKERS,
+        reload=SERVER_RELOAD
+    )
 
 # 使用 curl 测试新接口 /file_mineru
 # curl -X POST "http://localhost:8081/file_mineru" \